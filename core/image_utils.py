@@ -0,0 +1,23 @@
+"""
+Image utilities - uint8 görüntü işlemleri için ortak yardımcılar
+"""
+
+import cv2
+import numpy as np
+
+def downscale_to_fit(image: np.ndarray, max_size: int, interpolation: int = cv2.INTER_AREA) -> np.ndarray:
+    """
+    Görüntüyü uzun kenarı `max_size` olacak şekilde (en-boy oranını koruyarak) küçült
+
+    Zaten küçük olan görüntüler (mobil profil fotoğraflarında yaygın durum)
+    kopyalanmadan aynen döner.
+    """
+    h, w = image.shape[:2]
+    longest = h if h > w else w
+    if longest <= max_size:
+        return image
+
+    # Çok ince görüntülerde (örn. 800x1) kısa kenar 0'a yuvarlanıp cv2.resize'ı patlatmasın
+    scale = max_size / longest
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(image, size, interpolation=interpolation)
@@ -4,6 +4,11 @@ Ağır işlemler için ayrılmış mikroservis (NudeNet, background jobs, vb.)
 """
 
 import os
+
+# OpenMP thread limiti native kütüphaneler (numpy, cv2, TF) yüklenmeden ÖNCE ayarlanmalı;
+# routes → numpy/cv2 import zinciri services.inference_runtime'dan önce çalışır
+os.environ.setdefault("OMP_NUM_THREADS", os.getenv("INFERENCE_INTRA_OP_THREADS", "2"))
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -25,31 +30,47 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Kısmet Microservices starting up...")
     
-    # Initialize cache service (Redis connection)
+    # Initialize cache service (Redis connects in background, memory fallback until then)
     logger.info("🔗 Initializing cache service...")
     try:
-        from services.cache_service import cache_service
-        cache_stats = cache_service.get_stats()
-        logger.info(f"✅ Cache service ready: {cache_stats.get('backend', 'unknown')}")
+        from services.cache_service import get_cache_service
+        get_cache_service()
+        # Bağlantı sonucu (✅ Redis connected / ⚠️ failed) _verify_connection'da loglanır
+        logger.info("🔗 Cache service created: Redis connecting in background (in-memory fallback until connected)")
     except Exception as e:
         logger.warning(f"⚠️ Cache service failed: {e}")
     
     # 🔥 Warmup NudeNet model for content moderation
     logger.info("🧠 Warming up NudeNet model for content moderation...")
     try:
-        from routes.content_routes import warmup_nudenet
+        from services.inference_runtime import warmup_nudenet
         await warmup_nudenet()
         logger.info("✅ NudeNet model warmed up successfully")
     except Exception as e:
         logger.error(f"❌ NudeNet warmup failed: {e}")
         logger.warning("⚠️ Content moderation may be slower on first request")
     
+    # 🔥 Warmup DeepFace age model for child safety checks
+    logger.info("🧠 Warming up DeepFace age model...")
+    try:
+        from services.inference_runtime import warmup_age_model
+        await warmup_age_model()
+        logger.info("✅ DeepFace age model warmed up successfully")
+    except Exception as e:
+        logger.error(f"❌ DeepFace warmup failed: {e}")
+        logger.warning("⚠️ Age verification may be slower on first request")
+    
     logger.info("✅ Microservices startup completed!")
     
     yield
     
     # Shutdown
     logger.info("🛑 Kısmet Microservices shutting down...")
+    try:
+        from services.inference_runtime import nudenet_batcher
+        await nudenet_batcher.stop()
+    except Exception as e:
+        logger.warning(f"⚠️ NudeNet batcher shutdown failed: {e}")
 
 # ==================== FASTAPI SETUP ====================
 app = FastAPI(
@@ -82,8 +103,8 @@ async def health_check(request: Request):
         dict: Servis durumu ve temel bilgiler
     """
     try:
-        from services.cache_service import cache_service
-        cache_healthy = cache_service.redis_client is not None
+        from services.cache_service import get_cache_service
+        cache_healthy = get_cache_service().redis_client is not None
     except:
         cache_healthy = False
     
@@ -3,77 +3,64 @@
 Ana API'den ayrıştırılan ağır NudeNet işlemleri + 18+ yaş kontrolü
 """
 
-from fastapi import APIRouter, HTTPException, File, UploadFile
+from fastapi import APIRouter, HTTPException, File, Form, UploadFile
 from pydantic import BaseModel
-from typing import Optional, Dict
-import base64
-from datetime import datetime
+from typing import Optional, List, Union
+import binascii
 import io
-from PIL import Image
-import tempfile
-import os
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
-import hashlib
-import json
+import cv2
+import xxhash
 import logging
 import time
+import asyncio
+
+from services.inference_runtime import (
+    CONTENT_MODERATION_EXECUTOR,
+    CONTENT_MODERATION_JOB_SLOTS,
+    NUDENET_MODEL_ID,
+    content_moderation_pool,
+    get_pool_status,
+    is_nude_detector_loaded,
+    nudenet_batcher
+)
+from services.cache_service import get_cache_service
+from core.image_utils import downscale_to_fit
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# ==================== 🔥 DEDICATED CONTENT MODERATION THREAD POOL ====================
-content_moderation_pool = ThreadPoolExecutor(
-    max_workers=4,  # NudeNet için yeterli, çok thread gereksiz
-    thread_name_prefix="content_mod_"
-)
+# ==================== 🔥 CONTENT MODERATION CONCURRENCY ====================
+# Aynı anda pool'a gönderilen decode/yaş işi sayısını sınırla (burst'lerde ORT/TF
+# intra-op thread'lerinin aşırı yüklenmesini engeller). NudeNet batch'i için her
+# zaman boş bir worker kalır (bkz. CONTENT_MODERATION_JOB_SLOTS)
+_infer_sem = asyncio.Semaphore(CONTENT_MODERATION_JOB_SLOTS)
 
-# ==================== 🔥 OPTIMIZED NUDENET SINGLETON ====================
-_nude_detector = None
-_detector_loading = False
+# Decode sonrası çalışma çözünürlüğü (DeepFace küçük yüzler için buna ihtiyaç duyar)
+MAX_IMAGE_SIZE = 800
 
-def get_nude_detector():
-    """🔥 OPTIMIZED: Thread-safe lazy load NudeNet detector"""
-    global _nude_detector, _detector_loading
-    
-    # Thread-safe check: Eğer başka thread loading yapıyorsa bekle
-    if _detector_loading:
-        while _detector_loading and _nude_detector is None:
-            time.sleep(0.1)  # Wait for the other thread to complete loading
-        return _nude_detector
-    
-    if _nude_detector is None:
-        _detector_loading = True
-        logger.info("🧠 Loading NudeNet model...")
-        try:
-            from nudenet import NudeDetector
-            _nude_detector = NudeDetector()
-            logger.info("✅ NudeNet model loaded successfully")
-        except Exception as e:
-            logger.error(f"❌ NudeNet model loading failed: {e}")
-            raise
-        finally:
-            _detector_loading = False
-    
-    return _nude_detector
+# Decompression bomb koruması: cv2.imdecode 2^30 piksele kadar açar (PIL'in ~178 MP
+# sınırı yok), bu yüzden header'daki boyut decode'dan ÖNCE kontrol edilir
+MAX_IMAGE_PIXELS = 50_000_000  # 50 MP (~150 MB BGR raster)
 
-async def warmup_nudenet():
-    """Pre-loads the NudeNet model at startup."""
-    logger.info("🔥 [WARMUP] Pre-loading NudeNet model...")
-    try:
-        import asyncio
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(content_moderation_pool, get_nude_detector)
-        logger.info("✅ [WARMUP] NudeNet model pre-loaded successfully")
-    except Exception as e:
-        logger.error(f"❌ [WARMUP] NudeNet pre-load failed: {e}")
-        raise
+# Sıkıştırılmış görüntü boyutu sınırı (upload ve base64 payload)
+MAX_IMAGE_BYTES = 15 * 1024 * 1024  # 15 MB
+MAX_IMAGE_BASE64_CHARS = (MAX_IMAGE_BYTES + 2) // 3 * 4 + 64  # + data URL prefix payı
+
+# /detect/batch başına en fazla görüntü sayısı
+MAX_BATCH_IMAGES = 32
+
+# Aynı görüntü (re-upload, retry, review) için sonuçlar içerik hash'iyle cache'lenir
+RESULT_CACHE_TTL = 86400  # 24 saat
+# Label listesi / değerlendirme mantığı değişince artır: eski kararlar 24 saat servis edilmesin
+RESULT_CACHE_VERSION = 2
 
 # ==================== REQUEST/RESPONSE MODELS ====================
 class ContentModerationRequest(BaseModel):
     image_data: str  # Base64 encoded image
     sensitivity: Optional[str] = "normal"  # "high", "normal", "low"
+    check_age: bool = True  # False: sadece nudity kontrolü (örn. video call frame'leri); null kabul edilmez
     
 class ContentModerationResponse(BaseModel):
     nudity_detected: bool
@@ -83,219 +70,338 @@ class ContentModerationResponse(BaseModel):
     image_size_kb: float
     sensitivity_used: str
 
+# ==================== SENSITIVITY THRESHOLDS ====================
+# sensitivity → (nudity_threshold, age_threshold)
+# - "high": Profil fotoğrafı/story için - 16 yaş altı ret
+# - "normal": Video call için - 16 yaş altı ret
+# - "low": Daha toleranslı
+_SENSITIVITY_THRESHOLDS = {
+    "high": (0.45, 16),
+    "normal": (0.6, 16),
+    "low": (0.75, 16),
+}
+
+def _get_thresholds(sensitivity: str):
+    """Hassasiyet moduna göre (nudity_threshold, age_threshold) döner (bilinmeyen mod → normal)"""
+    return _SENSITIVITY_THRESHOLDS.get(sensitivity, _SENSITIVITY_THRESHOLDS["normal"])
+
 # ==================== CORE PROCESSING FUNCTIONS ====================
-def _sync_process_image_optimized(image_data_b64: str, sensitivity: str = "normal"):
+def _decode_with_pil(decoded_data: bytes):
+    """
+    PIL fallback decoder (OpenCV'nin açamadığı formatlar için)
+
+    JPEG'lerde `draft()` libjpeg'in DCT seviyesinde küçültmesini kullanır; tam
+    çözünürlükte decode etmeden hedef boyuta yakın bir raster üretir.
+    Diğer formatlarda no-op'tur. Son resize cv2 path'iyle ortak yapılır.
+    BGR döner (cv2.imdecode ile aynı sözleşme).
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(decoded_data))
+    image.draft('RGB', (MAX_IMAGE_SIZE, MAX_IMAGE_SIZE))
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+
+def _check_image_dimensions(decoded_data: bytes):
+    """
+    Görüntü boyutunu sadece header'dan oku (PIL lazy open, piksel decode etmez)
+    ve MAX_IMAGE_PIXELS üstünü reddet. PIL'in tanımadığı formatlar da reddedilir;
+    aksi halde cv2 bu kontrol olmadan açardı.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(decoded_data)) as image:
+        width, height = image.size
+
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image too large: {width}x{height} exceeds {MAX_IMAGE_PIXELS} pixels")
+
+def _decode_base64(image_data_b64: str) -> bytes:
+    """Base64 (veya `data:image/...;base64,` data URL) string'ini byte'lara çevir"""
+    if image_data_b64.startswith("data:"):
+        image_data_b64 = image_data_b64.partition(",")[2]
+    # base64.b64decode'un sarmaladığı C fonksiyonu (non-alphabet karakterleri yok sayar)
+    return binascii.a2b_base64(image_data_b64)
+
+def _sync_lookup_cached_result(image_data: Union[str, bytes], cache_prefix: str):
+    """
+    🔥 Base64 decode + içerik hash'i (xxh3) ile cache lookup
+
+    Her zaman ANA process'te (default executor) çalışır: process pool modunda
+    lookup child'da, yazma parent'ta olursa in-memory fallback ve negative cache
+    process'ler arasında bölünür ve cache hiç hit olmaz.
+
+    `image_data` base64 string (JSON endpoint) veya ham byte'lar (multipart upload)
+    olabilir. Hit varsa görüntü hiç decode edilmez.
+
+    Returns:
+        tuple: (image_size_kb, decoded_data, cache_key, final_result)
+        final_result None değilse (cache hit / base64 hatası) doğrudan döndürülecek sonuçtur.
+    """
+    # Step 1: Decode base64 data (in-memory), upload ise zaten ham byte
+    try:
+        decoded_data = image_data if isinstance(image_data, bytes) else _decode_base64(image_data)
+        image_size_kb = len(decoded_data) / 1024
+        logger.debug("📊 Image decoded: %.1f KB", image_size_kb)
+    except Exception as e:
+        logger.error(f"❌ Base64 decode error: {e}")
+        return 0.0, None, None, (0.0, False, 0.0, "Base64 decode failed")
+
+    # Step 1A: İçerik hash'i ile cache lookup
+    cache_key = f"{cache_prefix}:{xxhash.xxh3_64_hexdigest(decoded_data)}"
+    cached = get_cache_service().get_json(cache_key)
+    if cached is not None:
+        logger.debug("🎯 Moderation cache HIT: %s", cache_key)
+        return image_size_kb, decoded_data, cache_key, tuple(cached)
+
+    return image_size_kb, decoded_data, cache_key, None
+
+def _sync_decode_image(decoded_data: bytes, image_size_kb: float):
+    """
+    🔥 OPTIMIZED: In-memory decode + resize (hem NudeNet hem DeepFace için)
+
+    Moderasyon pool'unda çalışır; pool'a sadece sıkıştırılmış byte'lar gider.
+
+    Returns:
+        tuple: (np_array, final_result)
+        final_result None değilse (decode hatası) doğrudan döndürülecek sonuçtur.
+    """
+    # Step 2: OpenCV ile decode (hem NudeNet hem DeepFace için)
+    # IMREAD_COLOR her zaman 3 kanallı BGR döner (RGBA/gri tonlama dahil)
+    try:
+        _check_image_dimensions(decoded_data)
+
+        np_array = cv2.imdecode(np.frombuffer(decoded_data, np.uint8), cv2.IMREAD_COLOR)
+        if np_array is None:
+            # OpenCV'nin desteklemediği formatlar için PIL fallback
+            logger.debug("🔄 cv2.imdecode failed, falling back to PIL")
+            np_array = _decode_with_pil(decoded_data)
+
+        # Resim boyutunu optimize et (max 800x800), uint8 üzerinde SIMD INTER_AREA
+        np_array = downscale_to_fit(np_array, MAX_IMAGE_SIZE)
+
+        np_array = cv2.cvtColor(np_array, cv2.COLOR_BGR2RGB)
+    except Exception as e:
+        logger.error(f"❌ Image loading error: {e}")
+        return None, (image_size_kb, False, 0.0, f"Image load failed: {str(e)}")
+
+    return np_array, None
+
+def _sync_check_age(np_array, age_threshold: int):
     """
-    🔥 OPTIMIZED: In-memory NudeNet detection + 18+ Age Verification
-    
     ⚠️⚠️⚠️ CHILD SAFETY: 18 YAŞ ALTI TESPİT EDİLİRSE NOT SAFE! ⚠️⚠️⚠️
     - Bebek, çocuk, teenager → NOT SAFE (nudity_detected=True)
     - 18 yaş altı herhangi bir kişi → NOT SAFE
-    
-    Sensitivity modes:
-    - "high": Profil fotoğrafı/story için - nudity threshold: 0.45, yaş threshold: 20
-    - "normal": Video call için - nudity threshold: 0.6, yaş threshold: 18
-    - "low": Daha toleranslı - nudity threshold: 0.75, yaş threshold: 18
+
+    Returns:
+        tuple: (underage_detected, age_details)
+        underage_detected None ise yaş kontrolü başarısız olmuştur.
     """
-    start_time = time.time()
-    
-    # Hassasiyet ayarlarını belirle
-    if sensitivity == "high":
-        nudity_threshold = 0.45
-        age_threshold = 16  # Profil/story için: 16 yaş altı ret
-        logger.info("🔍 HIGH sensitivity mode: nudity_threshold=0.45, age_threshold=16")
-    elif sensitivity == "low":
-        nudity_threshold = 0.75
-        age_threshold = 16
-        logger.info("🔍 LOW sensitivity mode: nudity_threshold=0.75, age_threshold=16")
-    else:  # normal
-        nudity_threshold = 0.6
-        age_threshold = 16  # Video call için: 16 yaş altı ret
-        logger.info("🔍 NORMAL sensitivity mode: nudity_threshold=0.6, age_threshold=16")
-    
     try:
-        # Step 1: Decode base64 data (in-memory)
-        try:
-            decoded_data = base64.b64decode(image_data_b64)
-            image_size_kb = len(decoded_data) / 1024
-            logger.debug(f"📊 Image decoded: {image_size_kb:.1f} KB")
-        except Exception as e:
-            logger.error(f"❌ Base64 decode error: {e}")
-            return 0.0, False, 0.0, "Base64 decode failed"
-        
-        # Step 2: PIL Image oluştur (hem NudeNet hem DeepFace için)
-        try:
-            image = Image.open(io.BytesIO(decoded_data))
-            
-            # Convert to RGB if image has alpha channel (RGBA/LA) or other modes
-            if image.mode != 'RGB':
-                logger.debug(f"🔄 Converting image from {image.mode} to RGB")
-                image = image.convert('RGB')
-            
-            # Resim boyutunu optimize et (max 800x800)
-            max_size = 800
-            if max(image.size) > max_size:
-                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            np_array = np.array(image)
-        except Exception as e:
-            logger.error(f"❌ Image loading error: {e}")
-            return image_size_kb, False, 0.0, f"Image load failed: {str(e)}"
-        
-        # ⚠️⚠️⚠️ STEP 2A: 18 YAŞ ALTI KONTROLÜ (ÖNCELİKLİ!) ⚠️⚠️⚠️
-        underage_detected = False
-        age_details = ""
-        
-        try:
-            from deepface import DeepFace
-            
-            # DeepFace ile yaş tahmini yap
-            logger.info("🔍 [AGE_CHECK] Analyzing age...")
-            
-            # Yüz tespit et ve yaş tahmin et
-            analysis = DeepFace.analyze(
-                img_path=np_array,
-                actions=['age'],
-                enforce_detection=False,  # Yüz tespit edilemezse hata verme
-                detector_backend='opencv',  # Hızlı detector
-                silent=True
-            )
-            
-            # Analysis sonucunu kontrol et (list veya dict olabilir)
-            if isinstance(analysis, list):
-                analysis = analysis[0] if analysis else {}
-            
-            estimated_age = analysis.get('age', None)
-            
-            if estimated_age is not None:
-                logger.info(f"📊 [AGE_CHECK] Estimated age: {estimated_age}")
-                
-                # ⚠️ CRITICAL: Yaş kontrolü (hassasiyet moduna göre)
-                if estimated_age < age_threshold:
-                    underage_detected = True
-                    age_details = f"UNDERAGE DETECTED: Estimated age {estimated_age} (< {age_threshold})"
-                    logger.warning(f"🚨 [AGE_CHECK] {age_details}")
-                    
-                    # Yaş eşiği altı tespit edildi → NOT SAFE!
-                    return image_size_kb, True, 1.0, age_details
-                else:
-                    logger.info(f"✅ [AGE_CHECK] Age verification passed: {estimated_age} >= {age_threshold}")
-                    age_details = f"Age OK: {estimated_age}"
-            else:
-                # Yüz tespit edilemedi, yaş tahmin edilemedi
-                logger.info("⚠️ [AGE_CHECK] No face detected or age could not be estimated")
-                age_details = "Age verification: No face detected"
-                
-        except Exception as e:
-            # DeepFace hatası - güvenli varsayılan olarak devam et
-            logger.warning(f"⚠️ [AGE_CHECK] Age detection failed: {e}")
-            age_details = f"Age verification failed: {str(e)}"
-            # Yaş kontrolü başarısız oldu ama nudity kontrolüne devam et
-        
-        # Step 3: NudeNet ile nudity detection (yaş 18+ onaylandıysa)
-        nudity_detected = False
-        confidence_score = 0.0
-        detection_details = "No problematic content detected"
-        
-        try:
-            detector = get_nude_detector()
-            
-            # Tespit yap (NumPy array üzerinden)
-            detections = detector.detect(np_array)
-            
-            # Detection sonuçlarını değerlendir
-            problematic_classes = ['EXPOSED_ANUS', 'EXPOSED_BUTTOCKS', 'EXPOSED_BREAST_F', 
-                                 'EXPOSED_GENITALIA_F', 'EXPOSED_GENITALIA_M']
-            
-            high_confidence_detections = []
-            max_confidence = 0.0
-            
-            for detection in detections:
-                class_name = detection['class']
-                confidence = detection['score']
-                max_confidence = max(max_confidence, confidence)
-                
-                # Hassasiyet moduna göre threshold kullan
-                if class_name in problematic_classes and confidence > nudity_threshold:
-                    high_confidence_detections.append({
-                        'class': class_name,
-                        'confidence': confidence
-                    })
-            
-            if high_confidence_detections:
-                nudity_detected = True
-                confidence_score = max_confidence
-                detection_details = f"Nudity: {', '.join([d['class'] for d in high_confidence_detections])}"
-                if age_details:
-                    detection_details = f"{age_details} | {detection_details}"
-                logger.info(f"🚨 Nudity detected: {detection_details} (confidence: {confidence_score:.2f})")
-            else:
-                confidence_score = max_confidence
-                detection_details = age_details if age_details else f"Content is safe (max confidence: {confidence_score:.2f})"
-                logger.debug(f"✅ {detection_details}")
-                
-        except Exception as e:
-            logger.error(f"❌ NudeNet detection error: {e}")
-            return image_size_kb, False, 0.0, f"Detection failed: {str(e)}"
-        
-        processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
-        logger.info(f"⚡ Content moderation completed in {processing_time:.1f}ms")
-        
-        return image_size_kb, nudity_detected, confidence_score, detection_details
-        
+        from deepface import DeepFace
+
+        # DeepFace ile yaş tahmini yap
+        logger.info("🔍 [AGE_CHECK] Analyzing age...")
+
+        # Yüz tespit et ve yaş tahmin et
+        analysis = DeepFace.analyze(
+            img_path=np_array,
+            actions=['age'],
+            enforce_detection=False,  # Yüz tespit edilemezse hata verme
+            detector_backend='opencv',  # Hızlı detector
+            silent=True
+        )
+
+        # Analysis sonucunu kontrol et (list veya dict olabilir)
+        if isinstance(analysis, list):
+            analysis = analysis[0] if analysis else {}
+
+        estimated_age = analysis.get('age', None)
+
+        if estimated_age is not None:
+            logger.info(f"📊 [AGE_CHECK] Estimated age: {estimated_age}")
+
+            # ⚠️ CRITICAL: Yaş kontrolü (hassasiyet moduna göre)
+            if estimated_age < age_threshold:
+                age_details = f"UNDERAGE DETECTED: Estimated age {estimated_age} (< {age_threshold})"
+                logger.warning(f"🚨 [AGE_CHECK] {age_details}")
+
+                # Yaş eşiği altı tespit edildi → NOT SAFE!
+                return True, age_details
+
+            logger.info(f"✅ [AGE_CHECK] Age verification passed: {estimated_age} >= {age_threshold}")
+            return False, f"Age OK: {estimated_age}"
+
+        # Yüz tespit edilemedi, yaş tahmin edilemedi
+        logger.info("⚠️ [AGE_CHECK] No face detected or age could not be estimated")
+        return False, "Age verification: No face detected"
+
     except Exception as e:
-        logger.error(f"❌ Content moderation general error: {e}")
-        return 0.0, False, 0.0, f"Processing failed: {str(e)}"
+        # DeepFace hatası - güvenli varsayılan olarak devam et
+        # Yaş kontrolü başarısız oldu ama nudity kontrolüne devam et
+        logger.warning(f"⚠️ [AGE_CHECK] Age detection failed: {e}")
+        return None, f"Age verification failed: {str(e)}"
 
-# ==================== API ENDPOINTS ====================
-@router.post("/detect", response_model=ContentModerationResponse)
-async def detect_nudity(request: ContentModerationRequest):
+def _evaluate_detections(detections, nudity_threshold: float, age_details: str):
+    """NudeNet detection sonuçlarını hassasiyet eşiğine göre değerlendir"""
+    # Detection sonuçlarını değerlendir
+    # NudeNet v3 label isimleri (v2'deki EXPOSED_* isimleri 3.x modelinde hiç dönmez)
+    problematic_classes = ['ANUS_EXPOSED', 'BUTTOCKS_EXPOSED', 'FEMALE_BREAST_EXPOSED',
+                         'FEMALE_GENITALIA_EXPOSED', 'MALE_GENITALIA_EXPOSED']
+
+    high_confidence_detections = []
+    max_confidence = 0.0
+
+    for detection in detections:
+        class_name = detection['class']
+        confidence = detection['score']
+        max_confidence = max(max_confidence, confidence)
+
+        # Hassasiyet moduna göre threshold kullan
+        if class_name in problematic_classes and confidence > nudity_threshold:
+            high_confidence_detections.append({
+                'class': class_name,
+                'confidence': confidence
+            })
+
+    if high_confidence_detections:
+        nudity_detected = True
+        confidence_score = max_confidence
+        detection_details = f"Nudity: {', '.join([d['class'] for d in high_confidence_detections])}"
+        if age_details:
+            detection_details = f"{age_details} | {detection_details}"
+        logger.info(f"🚨 Nudity detected: {detection_details} (confidence: {confidence_score:.2f})")
+    else:
+        nudity_detected = False
+        confidence_score = max_confidence
+        detection_details = age_details if age_details else f"Content is safe (max confidence: {confidence_score:.2f})"
+        logger.debug("✅ %s", detection_details)
+
+    return nudity_detected, confidence_score, detection_details
+
+def _cache_result(loop, cache_key: str, result):
+    """Moderasyon sonucunu arka planda cache'e yaz (Redis round-trip'ini response'a eklemez)"""
+    loop.run_in_executor(None, get_cache_service().set_json, cache_key, list(result), RESULT_CACHE_TTL)
+
+async def _moderate_image(image_data: Union[str, bytes], sensitivity: str = "normal", check_age: bool = True):
     """
-    🔥 NudeNet Content Moderation Endpoint + 18+ Age Verification
-    
-    Ana API'den gelen base64 image'ı analiz eder.
-    ⚠️ CHILD SAFETY: Yaş eşiği altı tespit edilirse NOT SAFE döner!
-    
-    Sensitivity modes:
-    - "high": Profil fotoğrafı/story için - Daha sıkı kontrol (nudity: 0.45, age: 20)
-    - "normal": Video call için - Standart kontrol (nudity: 0.6, age: 18)
-    - "low": Daha toleranslı kontrol (nudity: 0.75, age: 18)
-    
-    Tam optimizasyon: in-memory processing, dedicated thread pool.
+    🔥 Tek görüntü için moderasyon pipeline'ı
+
+    1. Base64 decode + cache lookup → ana process (default executor), görüntü decode → moderasyon pool'u
+    2. Yaş kontrolü (thread pool) ve NudeNet detection (micro-batcher) PARALEL çalışır;
+       yaş eşiği altı tespit edilirse bekleyen NudeNet isteği iptal edilir.
+
+    Returns:
+        tuple: (image_size_kb, nudity_detected, confidence_score, detection_details)
     """
     start_time = time.time()
-    
+    nudity_threshold, age_threshold = _get_thresholds(sensitivity)
+
+    loop = asyncio.get_running_loop()
+    # Key: cache versiyonu + model + normalize edilmiş mod ve eşikleri ("NORMAL", "foo" → normal)
+    sensitivity_key = sensitivity if sensitivity in _SENSITIVITY_THRESHOLDS else "normal"
+    cache_prefix = (
+        f"mod:v{RESULT_CACHE_VERSION}:{NUDENET_MODEL_ID}:{sensitivity_key}:"
+        f"{nudity_threshold}:{age_threshold}:{'age' if check_age else 'noage'}"
+    )
+    image_size_kb, decoded_data, cache_key, final_result = await loop.run_in_executor(
+        None,
+        _sync_lookup_cached_result,
+        image_data,
+        cache_prefix
+    )
+    if final_result is not None:
+        return final_result
+
+    async with _infer_sem:
+        np_array, final_result = await loop.run_in_executor(
+            content_moderation_pool,
+            _sync_decode_image,
+            decoded_data,
+            image_size_kb
+        )
+    if final_result is not None:
+        return final_result
+
+    # Step 3: NudeNet detection hemen batcher'a gider, yaş kontrolüyle üst üste biner
+    nude_task = asyncio.ensure_future(nudenet_batcher.submit(np_array))
+
+    age_details = ""
+    underage_detected = False
+    if check_age:
+        try:
+            async with _infer_sem:
+                underage_detected, age_details = await loop.run_in_executor(
+                    content_moderation_pool,
+                    _sync_check_age,
+                    np_array,
+                    age_threshold
+                )
+        except BaseException:
+            nude_task.cancel()
+            raise
+
+        if underage_detected:
+            # Yaş eşiği altı → NudeNet sonucuna gerek yok
+            nude_task.cancel()
+            result = (image_size_kb, True, 1.0, age_details)
+            _cache_result(loop, cache_key, result)
+            return result
+
     try:
-        logger.info(f"🔍 Starting content moderation process (sensitivity: {request.sensitivity})...")
-        
-        # Run NudeNet detection + Age verification in dedicated thread pool (non-blocking)
-        import asyncio
-        loop = asyncio.get_event_loop()
-        
-        image_size_kb, nudity_detected, confidence_score, detection_details = await loop.run_in_executor(
-            content_moderation_pool, 
-            _sync_process_image_optimized,
-            request.image_data,
-            request.sensitivity  # ⚡ Hassasiyet parametresi eklendi
+        detections = await nude_task
+    except Exception as e:
+        logger.error(f"❌ NudeNet detection error: {e}")
+        return image_size_kb, False, 0.0, f"Detection failed: {str(e)}"
+
+    nudity_detected, confidence_score, detection_details = _evaluate_detections(
+        detections, nudity_threshold, age_details
+    )
+
+    processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
+    logger.info(f"⚡ Content moderation completed in {processing_time:.1f}ms")
+
+    result = (image_size_kb, nudity_detected, confidence_score, detection_details)
+    # Geçici yaş kontrolü hatalarını 24 saat boyunca sabitlememek için cache'leme
+    if underage_detected is not None:
+        _cache_result(loop, cache_key, result)
+
+    return result
+
+async def _run_moderation(image_data, sensitivity: str, check_age: bool) -> ContentModerationResponse:
+    """Moderasyonu çalıştır, sonucu logla ve response modeline dönüştür"""
+    start_time = time.time()
+
+    try:
+        logger.info(f"🔍 Starting content moderation process (sensitivity: {sensitivity})...")
+
+        # Decode + age verification thread pool'da, NudeNet micro-batcher üzerinden paralel (non-blocking)
+        image_size_kb, nudity_detected, confidence_score, detection_details = await _moderate_image(
+            image_data,
+            sensitivity,  # ⚡ Hassasiyet parametresi eklendi
+            check_age
         )
-        
+
         processing_time_ms = (time.time() - start_time) * 1000
-        
+
         response = ContentModerationResponse(
             nudity_detected=nudity_detected,
             confidence_score=confidence_score,
             detection_details=detection_details,
             processing_time_ms=processing_time_ms,
             image_size_kb=image_size_kb,
-            sensitivity_used=request.sensitivity  # ⚡ Kullanılan hassasiyet
+            sensitivity_used=sensitivity  # ⚡ Kullanılan hassasiyet
         )
-        
+
         # Log result
         status = "🚨 BLOCKED" if nudity_detected else "✅ SAFE"
-        logger.info(f"{status} [{request.sensitivity.upper()}] - Processing: {processing_time_ms:.1f}ms, Size: {image_size_kb:.1f}KB, Confidence: {confidence_score:.2f}")
-        
+        logger.info(f"{status} [{sensitivity.upper()}] - Processing: {processing_time_ms:.1f}ms, Size: {image_size_kb:.1f}KB, Confidence: {confidence_score:.2f}")
+
         return response
-        
+
     except Exception as e:
         logger.error(f"❌ Content moderation endpoint error: {e}")
         # Return safe default in case of error
@@ -305,20 +411,89 @@ async def detect_nudity(request: ContentModerationRequest):
             detection_details=f"Error: {str(e)}",
             processing_time_ms=(time.time() - start_time) * 1000,
             image_size_kb=0.0,
-            sensitivity_used=request.sensitivity
+            sensitivity_used=sensitivity
         )
 
+def _check_payload_size(image_data: Union[str, bytes]):
+    """Sıkıştırılmış görüntü (veya base64 string) boyut sınırını aşan isteği 413 ile reddet"""
+    limit = MAX_IMAGE_BYTES if isinstance(image_data, bytes) else MAX_IMAGE_BASE64_CHARS
+    if len(image_data) > limit:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image too large: max {MAX_IMAGE_BYTES // (1024 * 1024)} MB"
+        )
+
+# ==================== API ENDPOINTS ====================
+@router.post("/detect", response_model=ContentModerationResponse)
+async def detect_nudity(request: ContentModerationRequest):
+    """
+    🔥 NudeNet Content Moderation Endpoint + 18+ Age Verification
+
+    Ana API'den gelen base64 image'ı (veya data URL) analiz eder.
+    ⚠️ CHILD SAFETY: Yaş eşiği altı tespit edilirse NOT SAFE döner!
+
+    Sensitivity modes:
+    - "high": Profil fotoğrafı/story için - Daha sıkı kontrol (nudity: 0.45, age: 16)
+    - "normal": Video call için - Standart kontrol (nudity: 0.6, age: 16)
+    - "low": Daha toleranslı kontrol (nudity: 0.75, age: 16)
+    Bilinmeyen değerler "normal" olarak değerlendirilir (bkz. _SENSITIVITY_THRESHOLDS).
+
+    Tam optimizasyon: in-memory processing, dedicated thread pool, batched NudeNet inference.
+    """
+    _check_payload_size(request.image_data)
+    return await _run_moderation(request.image_data, request.sensitivity, request.check_age)
+
+@router.post("/detect/upload", response_model=ContentModerationResponse)
+async def detect_nudity_upload(
+    file: UploadFile = File(...),
+    sensitivity: str = Form("normal"),
+    check_age: bool = Form(True)
+):
+    """
+    🔥 Multipart upload ile Content Moderation (/detect ile aynı pipeline)
+
+    Büyük görüntüler için base64 yerine ham byte'lar gönderilir: kablo üzerinde
+    ~%33 daha az veri ve base64 decode adımı tamamen atlanır.
+    """
+    # Sınırın bir byte fazlasını oku: tamamını belleğe almadan aşımı tespit et
+    image_bytes = await file.read(MAX_IMAGE_BYTES + 1)
+    _check_payload_size(image_bytes)
+    return await _run_moderation(image_bytes, sensitivity, check_age)
+
+@router.post("/detect/batch", response_model=List[ContentModerationResponse])
+async def detect_nudity_batch(requests: List[ContentModerationRequest]):
+    """
+    🔥 Toplu Content Moderation (N görüntü, tek HTTP isteği)
+
+    Her görüntü /detect ile aynı pipeline'dan geçer; NudeNet istekleri
+    micro-batcher'da birleşerek tek inference çağrısına iner.
+    Sonuçlar istek sırasıyla döner.
+    """
+    if len(requests) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Too many images: max {MAX_BATCH_IMAGES} per batch")
+    for request in requests:
+        _check_payload_size(request.image_data)
+
+    return await asyncio.gather(*[
+        _run_moderation(request.image_data, request.sensitivity, request.check_age)
+        for request in requests
+    ])
+
 @router.get("/health")
 async def content_health():
     """Content moderation service health check"""
     try:
-        # Test if NudeNet model is loadable
-        detector_status = "loaded" if _nude_detector is not None else "unloaded"
+        # Process modunda model worker process'lerde yüklenir, parent'ın durumu anlamsız
+        if CONTENT_MODERATION_EXECUTOR == "process":
+            detector_status = "process_pool"
+        else:
+            detector_status = "loaded" if is_nude_detector_loaded() else "unloaded"
         
         return {
             "status": "healthy",
             "nudenet_model": detector_status,
-            "thread_pool_active": content_moderation_pool._threads is not None,
+            "thread_pool_active": content_moderation_pool is not None,
+            **get_pool_status(),
             "service": "content_moderation"
         }
     except Exception as e:
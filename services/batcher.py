@@ -0,0 +1,133 @@
+"""
+Inference Batcher - Eşzamanlı istekleri tek model çağrısında birleştiren async micro-batcher
+"""
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class InferenceBatcher:
+    """
+    🔥 Async micro-batcher
+
+    `submit()` ile gelen item'lar bir asyncio.Queue'ya konur. Arka plandaki worker,
+    `max_wait_ms` penceresi içinde gelen en fazla `max_batch` item'ı toplar ve
+    `process_batch(items)` fonksiyonunu executor içinde TEK seferde çalıştırır.
+    Sonuçlar sırasıyla her item'ın Future'ına dağıtılır.
+
+    `process_batch` her item için bir sonuç döndürmelidir; bir slot'ta Exception
+    dönerse sadece o item'ın Future'ı hata alır. Batch çağrısı bütünüyle patlarsa
+    item'lar tek tek yeniden denenir, böylece hatalı bir görüntü aynı batch'teki
+    diğer isteklerin sonucunu etkilemez.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        executor: Optional[Executor] = None,
+        max_batch: int = 16,
+        max_wait_ms: float = 8.0,
+        name: str = "batcher"
+    ):
+        self.process_batch = process_batch
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self):
+        """Worker task'ı ilk kullanımda (çalışan event loop içinde) başlat"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        # Worker yeniden başlarsa aynı kuyruk kullanılır, bekleyen item'lar kaybolmaz
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run(), name=f"{self.name}_worker")
+
+    async def submit(self, item: Any) -> Any:
+        """Item'ı kuyruğa ekle ve batch sonucu gelene kadar bekle"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """İlk item'ı bekle, ardından pencere dolana kadar batch'i doldur"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _process(self, loop, items: list) -> list:
+        """process_batch'i executor'da çalıştır, item başına bir sonuç garanti et"""
+        results = await loop.run_in_executor(self.executor, self.process_batch, items)
+        if len(results) != len(items):
+            raise RuntimeError(
+                f"{self.name}: process_batch returned {len(results)} results for {len(items)} items"
+            )
+        return results
+
+    async def _process_one_by_one(self, loop, items: list) -> list:
+        """Batch hatasında item'ları tek tek dene; hata sadece kendi slot'una yazılır"""
+        results = []
+        for item in items:
+            try:
+                results.extend(await self._process(loop, [item]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def _run(self):
+        """Batch worker loop"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect()
+
+            # İptal edilmiş istekleri modele göndermeye gerek yok
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = await self._process(loop, items)
+                logger.debug("📦 [%s] Processed batch of %d", self.name, len(batch))
+            except Exception as e:
+                if len(items) == 1:
+                    results = [e]
+                else:
+                    logger.error(f"❌ [{self.name}] Batch processing failed, retrying items one by one: {e}")
+                    results = await self._process_one_by_one(loop, items)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def stop(self):
+        """Worker task'ı durdur (shutdown)"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
@@ -3,44 +3,220 @@ Cache Service - Redis connection management for microservices
 """
 
 import redis
+from redis.utils import HIREDIS_AVAILABLE
+import json
 import logging
+import math
 import os
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from random import getrandbits
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
+# Hot-path serializers bound once: orjson (C, SIMD UTF-8) when available, stdlib json otherwise
+try:
+    import orjson
+    
+    _json_loads = orjson.loads
+    
+    def _json_dumps(value) -> bytes:
+        return orjson.dumps(value, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(value) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+# In-process L1 in front of Redis. Invalidation is local to this worker, so the
+# short TTL bounds how long other workers can serve a stale value. Writes from
+# this worker go to L1 with min(ttl, L1_CACHE_TTL); entries filled from a Redis
+# read do not know the key's remaining TTL and may be served up to L1_CACHE_TTL
+# seconds after the key expires in Redis.
+L1_CACHE_SIZE = 256
+L1_CACHE_TTL = 30
+
+# Negative cache: keys Redis reported missing are answered locally for a few
+# seconds instead of repeating the round trip (hot lookups of absent keys).
+NEGATIVE_CACHE_SIZE = 256
+NEGATIVE_CACHE_TTL = 5
+_MISS = object()
+
+class InMemoryCache:
+    """
+    Thread-safe in-process LRU cache with per-entry TTL (Redis fallback)
+    
+    Entries live in OrderedDicts as (value, expiry) tuples, where expiry is a
+    time.monotonic() timestamp: one dict lookup per operation and immune to
+    wall-clock jumps.
+    
+    Keys are spread over up to 16 shards (each holding at least 32 entries),
+    each with its own OrderedDict and lock, so threads touching different keys
+    do not serialize on one mutex. LRU order and capacity (max_size // shards)
+    are tracked per shard; reads only sample-promote entries, so recency is
+    approximate (hot keys still reach the MRU end after a few hits).
+    """
+    
+    MAX_SHARDS = 16
+    MIN_SHARD_SIZE = 32
+    EVICTION_SCAN = 8
+    PROMOTE_BITS = 3  # Hits promote with probability 1 / 2**PROMOTE_BITS
+    
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        
+        # Power-of-two shard count; small caches keep a single exact-LRU shard
+        num_shards = self.MAX_SHARDS
+        while num_shards > 1 and max_size // num_shards < self.MIN_SHARD_SIZE:
+            num_shards //= 2
+        self._shard_mask = num_shards - 1
+        self._shard_cap = max(1, max_size // num_shards)
+        self._shards: List[Tuple["OrderedDict[str, Tuple[Any, float]]", threading.Lock]] = [
+            (OrderedDict(), threading.Lock()) for _ in range(num_shards)
+        ]
+    
+    def _shard(self, key: str):
+        """(OrderedDict, Lock) pair owning this key"""
+        return self._shards[hash(key) & self._shard_mask]
+    
+    def get(self, key: str):
+        """
+        Get value, None if missing or expired
+        
+        Readers take no lock on the common path: a single OrderedDict lookup is
+        atomic under the GIL and every mutation happens under the shard lock.
+        The lock is only taken to drop an expired entry or for a sampled promotion.
+        """
+        now = time.monotonic()
+        cache, lock = self._shard(key)
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        
+        value, expiry = entry
+        if expiry <= now:
+            with lock:
+                # Only drop the entry we saw; a concurrent set may have replaced it
+                if cache.get(key) is entry:
+                    del cache[key]
+            return None
+        
+        # Approximate LRU: promote on ~1 in 8 hits to cut OrderedDict relinking
+        if not getrandbits(self.PROMOTE_BITS):
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+        return value
+    
+    def _evict(self, cache: "OrderedDict[str, Tuple[Any, float]]", now: float):
+        """
+        Make room for one entry (caller holds the shard lock)
+        
+        Expired entries among the EVICTION_SCAN least recently used ones are
+        reclaimed first; a live entry is evicted only when none of them expired.
+        """
+        expired = [
+            key for key, (_, expiry) in islice(cache.items(), self.EVICTION_SCAN)
+            if expiry <= now
+        ]
+        if expired:
+            for key in expired:
+                del cache[key]
+        else:
+            cache.popitem(last=False)
+    
+    def set(self, key: str, value: Any, ttl: int = 300):
+        """Set value with TTL (seconds), evicting from the shard's least recently used end when full"""
+        now = time.monotonic()
+        cache, lock = self._shard(key)
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+            elif len(cache) >= self._shard_cap:
+                self._evict(cache, now)
+            cache[key] = (value, now + ttl)
+    
+    def delete(self, key: str):
+        """Delete key"""
+        cache, lock = self._shard(key)
+        with lock:
+            cache.pop(key, None)
+    
+    def size(self) -> int:
+        """Approximate number of entries (stat only, read without locking)"""
+        return sum(len(cache) for cache, _ in self._shards)
+
 class CacheService:
-    """Redis cache service for microservices"""
+    """Redis cache service for microservices (in-memory fallback when Redis is unavailable)"""
     
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
+        self._pool: Optional[redis.BlockingConnectionPool] = None
+        self.memory_cache = InMemoryCache(max_size=1000)
+        # L1: hot Redis keys served in-process without a network round trip
+        self.l1_cache = InMemoryCache(max_size=L1_CACHE_SIZE)
+        self._neg_cache = InMemoryCache(max_size=NEGATIVE_CACHE_SIZE)
         self._connect()
     
     def _connect(self):
-        """Connect to Redis server"""
+        """
+        Build the Redis client and verify it in a background thread
+        
+        Until the first PING succeeds redis_client stays None and operations use
+        the in-memory fallback, so startup never blocks on socket_connect_timeout.
+        """
         try:
-            redis_host = os.getenv("REDIS_HOST", "localhost")
-            redis_port = int(os.getenv("REDIS_PORT", "6379"))
-            redis_db = int(os.getenv("REDIS_DB", "0"))
-            redis_password = os.getenv("REDIS_PASSWORD", None)
-            
-            self.redis_client = redis.Redis(
-                host=redis_host,
-                port=redis_port,
-                db=redis_db,
-                password=redis_password,
-                decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5
-            )
-            
-            # Test connection
-            self.redis_client.ping()
-            logger.info(f"✅ Redis connected: {redis_host}:{redis_port}")
+            # Bounded, blocking pool: burst'lerde socket açmak yerine boş bağlantıyı bekler
+            pool_kwargs = {
+                "max_connections": int(os.getenv("REDIS_POOL_SIZE", "16")),
+                "timeout": 2,
+                "socket_connect_timeout": 5,
+                "socket_timeout": 5,
+                "decode_responses": True,
+                "health_check_interval": 30
+            }
             
+            redis_url = os.getenv("REDIS_URL")
+            if redis_url:
+                self._pool = redis.BlockingConnectionPool.from_url(redis_url, **pool_kwargs)
+            else:
+                self._pool = redis.BlockingConnectionPool(
+                    host=os.getenv("REDIS_HOST", "localhost"),
+                    port=int(os.getenv("REDIS_PORT", "6379")),
+                    db=int(os.getenv("REDIS_DB", "0")),
+                    password=os.getenv("REDIS_PASSWORD", None),
+                    **pool_kwargs
+                )
+            client = redis.Redis(connection_pool=self._pool)
+        except Exception as e:
+            logger.warning("⚠️ Redis connection failed: %s", e)
+            return
+        
+        threading.Thread(
+            target=self._verify_connection,
+            args=(client,),
+            name="redis_connect",
+            daemon=True
+        ).start()
+    
+    def _verify_connection(self, client: redis.Redis):
+        """PING Redis and switch from the memory fallback on success"""
+        try:
+            client.ping()
         except Exception as e:
-            logger.warning(f"⚠️ Redis connection failed: {e}")
-            self.redis_client = None
+            logger.warning("⚠️ Redis connection failed: %s", e)
+            return
+        
+        self.redis_client = client
+        conn_kwargs = self._pool.connection_kwargs
+        parser = "hiredis" if HIREDIS_AVAILABLE else "python"
+        logger.info(
+            "✅ Redis connected: %s:%s (pool: %s, parser: %s)",
+            conn_kwargs.get("host"), conn_kwargs.get("port"), self._pool.max_connections, parser
+        )
     
     def get_stats(self):
         """Get cache statistics"""
@@ -57,42 +233,174 @@ class CacheService:
                 pass
         
         return {
-            "backend": "none",
-            "connected": False
+            "backend": "memory",
+            "connected": False,
+            "memory_entries": self.memory_cache.size()
         }
     
     def get(self, key: str):
         """Get value from cache"""
-        if not self.redis_client:
+        client = self.redis_client
+        if client is None:
+            return self.memory_cache.get(key)
+        
+        value = self.l1_cache.get(key)
+        if value is not None:
+            return value
+        if self._neg_cache.get(key) is _MISS:
             return None
         try:
-            return self.redis_client.get(key)
+            value = client.get(key)
         except Exception as e:
-            logger.error(f"Cache get error: {e}")
+            logger.error("Cache get error: %s", e)
             return None
+        if value is not None:
+            self.l1_cache.set(key, value, L1_CACHE_TTL)
+        else:
+            self._neg_cache.set(key, _MISS, NEGATIVE_CACHE_TTL)
+        return value
+    
+    def mget(self, keys: List[str]) -> list:
+        """Get multiple values in a single round trip (MGET), None for misses"""
+        if not keys:
+            return []
+        client = self.redis_client
+        if client is None:
+            memory_get = self.memory_cache.get
+            return [memory_get(key) for key in keys]
+        
+        l1_get = self.l1_cache.get
+        neg_get = self._neg_cache.get
+        values = [l1_get(key) for key in keys]
+        missing = [
+            i for i, value in enumerate(values)
+            if value is None and neg_get(keys[i]) is not _MISS
+        ]
+        if not missing:
+            return values
+        try:
+            fetched = client.mget([keys[i] for i in missing])
+        except Exception as e:
+            logger.error("Cache mget error: %s", e)
+            return values
+        for i, value in zip(missing, fetched):
+            if value is not None:
+                values[i] = value
+                self.l1_cache.set(keys[i], value, L1_CACHE_TTL)
+            else:
+                self._neg_cache.set(keys[i], _MISS, NEGATIVE_CACHE_TTL)
+        return values
     
-    def set(self, key: str, value: str, ttl: int = 300):
+    def set(self, key: str, value: Union[str, bytes], ttl: int = 300):
         """Set value in cache with TTL"""
-        if not self.redis_client:
-            return False
+        client = self.redis_client
+        if client is None:
+            self.memory_cache.set(key, value, ttl)
+            return True
+        self.l1_cache.delete(key)
+        self._neg_cache.delete(key)
         try:
-            self.redis_client.setex(key, ttl, value)
+            client.setex(key, ttl, value)
+        except Exception as e:
+            logger.error("Cache set error: %s", e)
+            return False
+        self._l1_write_through(key, value, ttl)
+        return True
+    
+    def mset(self, items: Dict[str, Union[str, bytes]], ttl: int = 300):
+        """Set multiple values with TTL in a single round trip (non-transactional pipeline)"""
+        if not items:
+            return True
+        client = self.redis_client
+        if client is None:
+            memory_set = self.memory_cache.set
+            for key, value in items.items():
+                memory_set(key, value, ttl)
             return True
+        
+        l1_delete = self.l1_cache.delete
+        neg_delete = self._neg_cache.delete
+        pipe = client.pipeline(transaction=False)
+        for key, value in items.items():
+            l1_delete(key)
+            neg_delete(key)
+            pipe.setex(key, ttl, value)
+        try:
+            pipe.execute()
         except Exception as e:
-            logger.error(f"Cache set error: {e}")
+            logger.error("Cache mset error: %s", e)
             return False
+        for key, value in items.items():
+            self._l1_write_through(key, value, ttl)
+        return True
+    
+    def _l1_write_through(self, key: str, value: Union[str, bytes], ttl: int):
+        """Cache a value just written to Redis in L1, never beyond its Redis TTL"""
+        # Redis reads return str (decode_responses=True); keep L1 hits consistent
+        if type(value) is bytes:
+            value = value.decode()
+        self.l1_cache.set(key, value, min(ttl, L1_CACHE_TTL))
+    
+    def get_json(self, key: str):
+        """Get JSON-decoded value from cache"""
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return _json_loads(value)
+        except ValueError as e:
+            logger.error("Cache JSON decode error: %s", e)
+            return None
+    
+    def set_json(self, key: str, value, ttl: int = 300):
+        """Set JSON-encoded value in cache with TTL"""
+        value_type = type(value)
+        
+        # Not worth caching: a cached None is indistinguishable from a miss
+        if value is None or callable(value):
+            return False
+        
+        # Scalars whose str() already is their JSON text skip the serializer
+        if value_type is int or (value_type is float and math.isfinite(value)):
+            return self.set(key, str(value), ttl)
+        if value_type is bool:
+            return self.set(key, "true" if value else "false", ttl)
+        
+        return self.set(key, _json_dumps(value), ttl)
     
     def delete(self, key: str):
         """Delete key from cache"""
-        if not self.redis_client:
-            return False
+        client = self.redis_client
+        if client is None:
+            self.memory_cache.delete(key)
+            return True
+        self.l1_cache.delete(key)
         try:
-            self.redis_client.delete(key)
+            client.delete(key)
             return True
         except Exception as e:
-            logger.error(f"Cache delete error: {e}")
+            logger.error("Cache delete error: %s", e)
             return False
 
-# Global cache service instance
-cache_service = CacheService()
+# ==================== LAZY SINGLETON ====================
+_cache_singleton: Optional[CacheService] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+def get_cache_service() -> CacheService:
+    """
+    Process-wide CacheService, created on first use
+    
+    A forked worker process (process pool executor) gets its own instance
+    instead of inheriting the parent's client and connection state.
+    """
+    global _cache_singleton, _cache_pid
+    
+    pid = os.getpid()
+    if _cache_singleton is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache_singleton is None or _cache_pid != pid:
+                _cache_singleton = CacheService()
+                _cache_pid = pid
+    return _cache_singleton
 
@@ -0,0 +1,327 @@
+"""
+Inference Runtime - Paylaşılan model ve thread pool kaynakları
+NudeNet/DeepFace modelleri, dedicated thread pool ve NudeNet micro-batcher burada
+process başına TEK kez oluşturulur; tüm route'lar bunları import ederek paylaşır.
+"""
+
+import os
+
+# ==================== 🔥 INFERENCE THREAD LIMITS ====================
+# Eşzamanlı çalışan yaş kontrolleri (DeepFace/TF) pool thread'i başına kendi intra-op
+# thread'lerini açar; varsayılan (cpu_count) ile 4 eşzamanlı istek 8 çekirdekte 32+
+# thread'e çıkar. OMP_NUM_THREADS main.py'de tüm import'lardan önce ayarlanır; buradaki
+# setdefault sadece modül main.py dışından import edildiğinde devreye girer.
+INFERENCE_INTRA_OP_THREADS = int(os.getenv("INFERENCE_INTRA_OP_THREADS", "2"))
+os.environ.setdefault("OMP_NUM_THREADS", str(INFERENCE_INTRA_OP_THREADS))
+
+# uvicorn worker process sayısı (uvicorn --workers varsayılanını WEB_CONCURRENCY'den okur)
+UVICORN_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# NudeNet micro-batcher aynı anda TEK detect_batch çalıştırır; ORT session'ı bu
+# uvicorn worker'ına düşen çekirdeklerin tamamını kullanabilir
+NUDENET_INTRA_OP_THREADS = int(os.getenv(
+    "NUDENET_INTRA_OP_THREADS",
+    str(max(1, (os.cpu_count() or 1) // UVICORN_WORKERS))
+))
+
+import asyncio
+import logging
+import threading
+import platform
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import cv2
+
+from services.batcher import InferenceBatcher
+from core.image_utils import downscale_to_fit
+
+logger = logging.getLogger(__name__)
+
+# ==================== 🔥 CONTENT MODERATION EXECUTOR SETTINGS ====================
+# "thread" (default): GPU veya tek çekirdek ağırlıklı deployment'lar, model process'te bir kez
+# "process": GPU'suz çok çekirdekli Linux; her worker process kendi modelini yükler ve
+#            DeepFace/TF'in Python tarafı GIL'e takılmadan gerçek paralellik sağlar
+CONTENT_MODERATION_EXECUTOR = (
+    "process"
+    if os.getenv("CONTENT_MODERATION_EXECUTOR", "thread") == "process" and platform.system() == "Linux"
+    else "thread"
+)
+if CONTENT_MODERATION_EXECUTOR == "process":
+    # Her uvicorn worker'ı kendi pool'unu açar: çekirdekler worker'lar arasında paylaştırılır
+    _default_workers = max(1, (os.cpu_count() or 4) // UVICORN_WORKERS)
+else:
+    _default_workers = 4  # NudeNet için yeterli, çok thread gereksiz
+CONTENT_MODERATION_WORKERS = int(os.getenv("CONTENT_MODERATION_WORKERS", _default_workers))
+
+# ==================== 🔥 OPTIMIZED NUDENET SINGLETON ====================
+# Sonuç cache key'inin parçası: model değişince (örn. INT8 swap) eski kararlar okunmaz
+NUDENET_MODEL_ID = os.path.basename(os.getenv("NUDENET_MODEL_PATH") or "320n.onnx")
+
+_nude_detector = None
+_detector_lock = threading.Lock()
+_detector_ready = threading.Event()
+
+def _get_onnx_providers():
+    """
+    ONNX Runtime execution provider listesi
+
+    CUDA varsa GPU'yu (heuristic conv algo search ile) önceliklendirir,
+    her durumda CPU fallback olarak kalır.
+    """
+    import onnxruntime as ort
+
+    providers = []
+    if "CUDAExecutionProvider" in ort.get_available_providers():
+        providers.append(("CUDAExecutionProvider", {
+            "device_id": int(os.getenv("CUDA_DEVICE_ID", "0")),
+            "cudnn_conv_algo_search": "HEURISTIC"
+        }))
+    providers.append("CPUExecutionProvider")
+
+    logger.info(f"🧠 ONNX Runtime providers: {[p[0] if isinstance(p, tuple) else p for p in providers]}")
+    return providers
+
+def _get_session_options():
+    """ONNX Runtime session ayarları: process'in çekirdek payı kadar intra-op thread, tam graph optimizasyonu"""
+    import onnxruntime as ort
+
+    sess_options = ort.SessionOptions()
+    sess_options.intra_op_num_threads = NUDENET_INTRA_OP_THREADS
+    sess_options.inter_op_num_threads = 1
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return sess_options
+
+def get_nude_detector():
+    """🔥 OPTIMIZED: Thread-safe lazy load NudeNet detector (double-checked locking)"""
+    global _nude_detector
+
+    # Fast path: model zaten yüklü, lock gerekmez
+    if _nude_detector is not None:
+        return _nude_detector
+
+    # Başka thread yüklüyorsa lock üzerinde bekle (busy-wait yok)
+    with _detector_lock:
+        if _nude_detector is None:
+            logger.info("🧠 Loading NudeNet model...")
+            try:
+                import nudenet
+                import onnxruntime as ort
+                from nudenet import NudeDetector
+
+                # Örn. offline INT8-quantized model, yoksa paket içindeki model
+                model_path = os.getenv("NUDENET_MODEL_PATH") or os.path.join(
+                    os.path.dirname(nudenet.__file__), "320n.onnx"
+                )
+                # NudeDetector.__init__ (3.4.2) `providers`'ı yok sayıyor ve SessionOptions
+                # kabul etmiyor: session'ı TEK kez kendimiz kurup detector'a veriyoruz
+                session = ort.InferenceSession(
+                    model_path,
+                    sess_options=_get_session_options(),
+                    providers=_get_onnx_providers()
+                )
+                model_input = session.get_inputs()[0]
+                resolution = model_input.shape[2] if isinstance(model_input.shape[2], int) else 320
+
+                detector = NudeDetector.__new__(NudeDetector)
+                detector.onnx_session = session
+                detector.input_name = model_input.name
+                detector.input_width = resolution
+                detector.input_height = resolution
+
+                _nude_detector = detector
+                _detector_ready.set()
+                logger.info("✅ NudeNet model loaded successfully")
+            except Exception as e:
+                logger.error(f"❌ NudeNet model loading failed: {e}")
+                raise
+
+    return _nude_detector
+
+def is_nude_detector_loaded() -> bool:
+    """NudeNet modeli bu process'te yüklendi mi? (process pool modunda modeller worker'larda)"""
+    return _detector_ready.is_set()
+
+def _load_nude_detector():
+    """Executor içinde NudeNet'i yükle (process pool'da detector pickle edilemez, None döner)"""
+    get_nude_detector()
+
+async def warmup_nudenet():
+    """Pre-loads the NudeNet model at startup."""
+    logger.info("🔥 [WARMUP] Pre-loading NudeNet model...")
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(content_moderation_pool, _load_nude_detector)
+        logger.info("✅ [WARMUP] NudeNet model pre-loaded successfully")
+    except Exception as e:
+        logger.error(f"❌ [WARMUP] NudeNet pre-load failed: {e}")
+        raise
+
+def _configure_tensorflow_threads():
+    """DeepFace'in TF runtime'ını aynı intra-op limitine bağla (TF başlatılmadan önce çağrılmalı)"""
+    try:
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_INTRA_OP_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError as e:
+        # TF zaten başlatılmış: ayarlar değiştirilemez
+        logger.warning(f"⚠️ TensorFlow thread limits not applied: {e}")
+
+def _sync_warmup_age_model():
+    """
+    DeepFace age modeli + OpenCV face detector'ı yükle
+
+    DeepFace ağırlıkları ilk `analyze` çağrısında lazy yükler; boş bir görüntü
+    üzerinde tek çağrı import maliyetini, ağırlık yüklemesini ve TF graph
+    hazırlığını startup'a taşır.
+    """
+    _configure_tensorflow_threads()
+    from deepface import DeepFace
+
+    DeepFace.analyze(
+        img_path=np.zeros((64, 64, 3), dtype=np.uint8),
+        actions=['age'],
+        enforce_detection=False,
+        detector_backend='opencv',
+        silent=True
+    )
+
+async def warmup_age_model():
+    """Pre-loads the DeepFace age model at startup."""
+    logger.info("🔥 [WARMUP] Pre-loading DeepFace age model...")
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(content_moderation_pool, _sync_warmup_age_model)
+        logger.info("✅ [WARMUP] DeepFace age model pre-loaded successfully")
+    except Exception as e:
+        logger.error(f"❌ [WARMUP] DeepFace age model pre-load failed: {e}")
+        raise
+
+# ==================== 🔥 DEDICATED CONTENT MODERATION POOL ====================
+def _preload_worker_models():
+    """
+    Process pool worker initializer: modelleri her worker process'te önceden yükle
+
+    Hata pool'u kırmasın diye yutulur; model ilk istekte tekrar yüklenmeyi dener.
+    """
+    try:
+        get_nude_detector()
+        _sync_warmup_age_model()
+    except Exception as e:
+        logger.error(f"❌ [WORKER] Model pre-load failed in pid {os.getpid()}: {e}")
+
+def _create_process_pool() -> ProcessPoolExecutor:
+    # fork: worker'lar ilk submit'te (warmup) ana process model yüklemeden önce açılır
+    return ProcessPoolExecutor(
+        max_workers=CONTENT_MODERATION_WORKERS,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_preload_worker_models
+    )
+
+class _SelfHealingProcessPool(Executor):
+    """
+    ProcessPoolExecutor proxy'si: bir child process ölürse (örn. OOM kill) pool
+    kalıcı olarak BrokenProcessPool durumuna düşer. Bu durumda pool yeniden kurulur;
+    o an uçuşta olan işler hata alır, sonraki işler yeni pool'a gider.
+    """
+
+    def __init__(self):
+        self._pool = _create_process_pool()
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    def _rebuild(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Kırık pool'u (hala güncel olan buysa) tek seferde yenisiyle değiştir"""
+        with self._lock:
+            if self._pool is broken:
+                logger.error("❌ Content moderation process pool is broken, rebuilding it")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = _create_process_pool()
+                self.restarts += 1
+            return self._pool
+
+    def _on_done(self, pool: ProcessPoolExecutor, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._rebuild(pool)
+
+    def submit(self, fn, /, *args, **kwargs):
+        pool = self._pool
+        try:
+            future = pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            pool = self._rebuild(pool)
+            future = pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda f: self._on_done(pool, f))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+if CONTENT_MODERATION_EXECUTOR == "process":
+    content_moderation_pool = _SelfHealingProcessPool()
+    # Model child process'lerde: NudeNet batch'leri aynı pool'a gider
+    nudenet_executor = content_moderation_pool
+    # Decode/yaş işlerine bir worker eksik izin ver, batch işi kuyrukta beklemesin
+    CONTENT_MODERATION_JOB_SLOTS = max(1, CONTENT_MODERATION_WORKERS - 1)
+else:
+    content_moderation_pool = ThreadPoolExecutor(
+        max_workers=CONTENT_MODERATION_WORKERS,
+        thread_name_prefix="content_mod_"
+    )
+    # Batcher aynı anda tek detect_batch çalıştırır: kendi thread'i, decode/DeepFace
+    # işleriyle dolan pool kuyruğunun arkasında beklemez
+    nudenet_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nudenet_batch_")
+    CONTENT_MODERATION_JOB_SLOTS = CONTENT_MODERATION_WORKERS
+
+def get_pool_status() -> dict:
+    """Health check için executor bilgisi"""
+    return {
+        "executor": CONTENT_MODERATION_EXECUTOR,
+        "workers": CONTENT_MODERATION_WORKERS,
+        "pool_restarts": getattr(content_moderation_pool, "restarts", 0)
+    }
+
+# ==================== 🔥 NUDENET MICRO-BATCHER ====================
+def _sync_detect_batch(np_arrays):
+    """
+    🔥 BATCHED: Tek ONNX Runtime çağrısında birden fazla görüntü için NudeNet detection
+
+    NudeNet her görüntüyü kendi içinde kareye pad'leyip model girişine resize eder,
+    bu yüzden farklı boyutlu görüntüler aynı batch'te gönderilebilir. Görüntüler
+    önceden uzun kenarı model girişine (örn. 320) eşit olacak şekilde küçültülür;
+    böylece NudeNet'in kendi resize adımı no-op olur ve ORT'a C-contiguous buffer gider.
+    Yaş kontrolü küçük yüzler için 800px görüntüyü kullanmaya devam eder.
+
+    Ön işleme hatası sadece o görüntünün slot'una Exception olarak yazılır;
+    batch'teki diğer istekler normal şekilde modele gider.
+    """
+    detector = get_nude_detector()
+    input_size = detector.input_width
+
+    results = [None] * len(np_arrays)
+    inputs, slots = [], []
+    for i, np_array in enumerate(np_arrays):
+        try:
+            inputs.append(np.ascontiguousarray(downscale_to_fit(np_array, input_size, cv2.INTER_LINEAR)))
+            slots.append(i)
+        except Exception as e:
+            logger.warning(f"⚠️ NudeNet preprocessing failed for batch item {i}: {e}")
+            results[i] = e
+
+    if inputs:
+        for i, detections in zip(slots, detector.detect_batch(inputs, batch_size=len(inputs))):
+            results[i] = detections
+
+    return results
+
+# Eşzamanlı istekleri 8ms pencerede en fazla 16'lık batch'lerde topla
+nudenet_batcher = InferenceBatcher(
+    _sync_detect_batch,
+    executor=nudenet_executor,
+    max_batch=16,
+    max_wait_ms=8,
+    name="nudenet"
+)